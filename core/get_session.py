@@ -7,125 +7,404 @@ Captures visible (uncovered) windows, takes screenshots, and saves a JSON that i
 """
 
 import os
+import re
+import base64
+import struct
 import json
 import platform
 import datetime
 import socket
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from bisect import insort
+from collections import namedtuple
+from functools import lru_cache
 from PIL import Image
 
+_SYSTEM = platform.system()
+
+# Anything but letters, digits, space, '_' and '-' (\w is Unicode-aware like isalnum).
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w \-]+')
+
+# One `wmctrl -lG` line: id, desktop, x, y, width, height, then the rest.
+_WMCTRL_RE = re.compile(r'^(\S+)\s+\S+\s+(-?\d+)\s+(-?\d+)\s+(\d+)\s+(\d+)\s+(.*)$')
+
+_IMAGE_SIGNATURES = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff')
+
+Rect = namedtuple('Rect', 'x y w h')
+
+# Below this many windows the per-call NumPy overhead outweighs batched clipping.
+_NP_MIN_WINDOWS = 16
+
+# Captures are bound by the display round-trip and PNG encoding, both of which
+# release the GIL; past a handful of threads the display server is the limit.
+_MAX_CAPTURE_WORKERS = 8
+
+# Screenshots only need to identify the window, so they are shrunk to fit this
+# many pixels on the long edge before encoding.
+DEFAULT_MAX_DIM = 800
+_BILINEAR = getattr(Image, 'Resampling', Image).BILINEAR
+
+# Grid size of the compact uncovered-region bitmap; one uint64 per row.
+_BITMAP_TILES = 64
+
+# Platform backends are imported on first use and memoized, so hot paths skip the
+# import machinery and the backends of other platforms are never loaded.
+
+@lru_cache(maxsize=None)
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+@lru_cache(maxsize=None)
+def _orjson():
+    try:
+        import orjson
+        return orjson
+    except ImportError:
+        return None
+
+@lru_cache(maxsize=None)
+def _imagegrab():
+    from PIL import ImageGrab
+    return ImageGrab
+
+@lru_cache(maxsize=None)
+def _mss():
+    import mss
+    return mss
+
+@lru_cache(maxsize=None)
+def _quartz():
+    import Quartz
+    return Quartz
+
+@lru_cache(maxsize=None)
+def _nsworkspace():
+    from AppKit import NSWorkspace
+    return NSWorkspace
+
+@lru_cache(maxsize=None)
+def _xlib():
+    from Xlib import display, error, X
+    return display, error, X
+
+@lru_cache(maxsize=None)
+def _pygetwindow():
+    import pygetwindow
+    return pygetwindow
+
 def sanitize_filename(s: str) -> str:
-    safe = ''.join(c for c in s if c.isalnum() or c in (' ', '_', '-')).rstrip()
+    safe = _UNSAFE_FILENAME_RE.sub('', s).rstrip()
     return safe.replace(' ', '_')[:50]
 
 def is_image_valid(path: str) -> bool:
+    """Cheap sanity check: the file exists and starts with a PNG or JPEG signature."""
     try:
-        with Image.open(path) as img:
-            img.verify()
-        return True
-    except Exception:
+        with open(path, 'rb') as f:
+            return f.read(8).startswith(_IMAGE_SIGNATURES)
+    except OSError:
         return False
 
 def rect_intersect(a, b):
-    x1 = max(a['x'], b['x'])
-    y1 = max(a['y'], b['y'])
-    x2 = min(a['x'] + a['w'], b['x'] + b['w'])
-    y2 = min(a['y'] + a['h'], b['y'] + b['h'])
-    if x1 < x2 and y1 < y2:
-        return {'x': x1, 'y': y1, 'w': x2 - x1, 'h': y2 - y1}
-    return None
+    # Reject rects separated on either axis before doing any min/max work.
+    if a.x + a.w <= b.x or b.x + b.w <= a.x or a.y + a.h <= b.y or b.y + b.h <= a.y:
+        return None
+    x1 = max(a.x, b.x)
+    y1 = max(a.y, b.y)
+    x2 = min(a.x + a.w, b.x + b.w)
+    y2 = min(a.y + a.h, b.y + b.h)
+    return Rect(x1, y1, x2 - x1, y2 - y1)
 
 def rect_subtract(rect, covered):
-    remaining = [rect]
+    """
+    Return the parts of `rect` not covered by any rect in `covered`.
+    Sweeps top-to-bottom over the y-edges of the occluders, keeping the active
+    occluders sorted by x and emitting the gaps between them for each band.
+    Gaps with the same x-extent in consecutive bands are merged into one Rect.
+    """
+    if not covered:
+        return [rect]
+
+    rx0, ry0, rw, rh = rect
+    rx1, ry1 = rx0 + rw, ry0 + rh
+    clips = []
     for c in covered:
-        new_remaining = []
-        for r in remaining:
-            inter = rect_intersect(r, c)
-            if not inter:
-                new_remaining.append(r)
-                continue
-            x0, y0 = r['x'], r['y']
-            x1, y1 = x0 + r['w'], y0 + r['h']
-            ix0, iy0 = inter['x'], inter['y']
-            ix1, iy1 = ix0 + inter['w'], iy0 + inter['h']
-            # Top strip
-            if iy0 > y0:
-                new_remaining.append({
-                    'x': x0,
-                    'y': y0,
-                    'w': r['w'],
-                    'h': iy0 - y0
-                })
-            # Bottom strip
-            if iy1 < y1:
-                new_remaining.append({
-                    'x': x0,
-                    'y': iy1,
-                    'w': r['w'],
-                    'h': y1 - iy1
-                })
-            # Left strip
-            if ix0 > x0:
-                new_remaining.append({
-                    'x': x0,
-                    'y': max(y0, iy0),
-                    'w': ix0 - x0,
-                    'h': min(y1, iy1) - max(y0, iy0)
-                })
-            # Right strip
-            if ix1 < x1:
-                new_remaining.append({
-                    'x': ix1,
-                    'y': max(y0, iy0),
-                    'w': x1 - ix1,
-                    'h': min(y1, iy1) - max(y0, iy0)
-                })
-        remaining = [r for r in new_remaining if r['w'] > 0 and r['h'] > 0]
+        cx0, cy0, cw, ch = c
+        cx1, cy1 = cx0 + cw, cy0 + ch
+        # Most occluders miss the candidate entirely; skip them without a call.
+        if cx0 >= rx1 or cx1 <= rx0 or cy0 >= ry1 or cy1 <= ry0:
+            continue
+        if cx0 <= rx0 and cy0 <= ry0 and cx1 >= rx1 and cy1 >= ry1:
+            # Fully inside one occluder (e.g. a dialog behind its parent).
+            return []
+        clips.append(rect_intersect(rect, c))
+    return _sweep(rect, clips)
+
+def _rects_to_xyxy(rects):
+    """Pack Rects into an (N, 4) int32 array of [x0, y0, x1, y1] rows."""
+    np = _numpy()
+    xyxy = np.array([(r.x, r.y, r.x + r.w, r.y + r.h) for r in rects], dtype=np.int32)
+    return xyxy.reshape(-1, 4)
+
+def _clip_np(rect, covered_xyxy):
+    """Batched rect_intersect of `rect` against every row of `covered_xyxy`."""
+    if not len(covered_xyxy):
+        return []
+    np = _numpy()
+    ix0 = np.maximum(rect.x, covered_xyxy[:, 0])
+    iy0 = np.maximum(rect.y, covered_xyxy[:, 1])
+    ix1 = np.minimum(rect.x + rect.w, covered_xyxy[:, 2])
+    iy1 = np.minimum(rect.y + rect.h, covered_xyxy[:, 3])
+    keep = (ix0 < ix1) & (iy0 < iy1)
+    clipped = np.stack((ix0, iy0, ix1 - ix0, iy1 - iy0), axis=1)[keep]
+    return [Rect(*row) for row in clipped.tolist()]
+
+def _neg_area(r):
+    return -r.w * r.h
+
+def _drop_nested(clips):
+    """
+    Drop clips contained in a larger clip: they add sweep events but never
+    change the gaps. Checking the biggest occluders first keeps `kept` short.
+    """
+    kept = []
+    for c in sorted(clips, key=_neg_area):
+        cx1, cy1 = c.x + c.w, c.y + c.h
+        for k in kept:
+            if k.x <= c.x and k.y <= c.y and k.x + k.w >= cx1 and k.y + k.h >= cy1:
+                break
+        else:
+            kept.append(c)
+    return kept
+
+def _sweep(rect, clips):
+    """Subtract `clips` (already clipped to `rect`) from `rect`."""
+    if not clips:
+        return [rect]
+    clips = _drop_nested(clips)
+    if clips[0] == rect:
+        return []
+
+    x0, y0, w, h = rect
+    x1, y1 = x0 + w, y0 + h
+    # Edges are computed once per clip rather than once per band: (top, left, right, bottom).
+    edges = sorted((c.y, c.x, c.x + c.w, c.y + c.h) for c in clips)
+    ys = sorted({y0, y1, *(e[0] for e in edges), *(e[3] for e in edges)})
+
+    remaining = []
+    active = []  # (left, right, bottom) of the clips spanning the band, by left edge
+    open_gaps = {}  # (gx0, gx1) -> y where the gap started
+    i, n = 0, len(edges)
+    for by0 in ys[:-1]:
+        active = [a for a in active if a[2] > by0]
+        while i < n and edges[i][0] <= by0:
+            _, cx0, cx1, cy1 = edges[i]
+            insort(active, (cx0, cx1, cy1))
+            i += 1
+
+        # Gaps come out left-to-right with positive width by construction.
+        gaps = {}
+        cur = x0
+        for cx0, cx1, _ in active:
+            if cx0 > cur:
+                gaps[(cur, cx0)] = open_gaps.pop((cur, cx0), by0)
+            if cx1 > cur:
+                cur = cx1
+        if cur < x1:
+            gaps[(cur, x1)] = open_gaps.pop((cur, x1), by0)
+
+        for (gx0, gx1), gy in open_gaps.items():
+            remaining.append(Rect(gx0, gy, gx1 - gx0, by0 - gy))
+        open_gaps = gaps
+
+    for (gx0, gx1), gy in open_gaps.items():
+        remaining.append(Rect(gx0, gy, gx1 - gx0, y1 - gy))
     return remaining
 
-def capture_region(geom: dict, path: str) -> bool:
-    system = platform.system()
+def compute_visible(windows):
+    """
+    Given window Rects ordered front-to-back, return the uncovered Rects of each
+    window (occluded by every window in front of it).
+    """
+    if len(windows) >= _NP_MIN_WINDOWS and _numpy() is not None:
+        xyxy = _rects_to_xyxy(windows)
+        return [_sweep(rect, _clip_np(rect, xyxy[:i])) for i, rect in enumerate(windows)]
+
+    # Keep occluders largest-first so big windows are tested (and usually
+    # swallow the candidate) before small ones.
+    covered = []
+    visible = []
+    for rect in windows:
+        visible.append(rect_subtract(rect, covered))
+        insort(covered, rect, key=_neg_area)
+    return visible
+
+def regions_bitmap(geom: Rect, regions) -> str:
+    """
+    Rasterize `regions` onto a 64x64 grid of tiles spanning `geom`. A tile's bit
+    is set when any uncovered region overlaps it. Rows run top-to-bottom as
+    big-endian uint64s with bit 0 the leftmost column, base64-encoded (512 bytes).
+    """
+    x0, y0, w, h = geom
+    n = _BITMAP_TILES
+    rows = [0] * n
+    for rx, ry, rw, rh in regions:
+        c0 = (rx - x0) * n // w
+        c1 = -(-(rx + rw - x0) * n // w)
+        r0 = (ry - y0) * n // h
+        r1 = -(-(ry + rh - y0) * n // h)
+        mask = ((1 << (c1 - c0)) - 1) << c0
+        for r in range(r0, r1):
+            rows[r] |= mask
+    return base64.b64encode(struct.pack(f'>{n}Q', *rows)).decode('ascii')
+
+def _save_screenshot(img, path: str, max_dim=None) -> None:
+    # Screenshots are throwaway thumbnails: favour encode speed over file size.
+    if max_dim:
+        img.thumbnail((max_dim, max_dim), _BILINEAR)
+    if path.lower().endswith(('.jpg', '.jpeg')):
+        img.convert('RGB').save(path, 'JPEG', quality=75)
+    else:
+        img.save(path, 'PNG', optimize=False, compress_level=1)
+
+def _capture_imagegrab(geom: Rect, path: str, sct=None, max_dim=None) -> None:
+    x, y, w, h = geom
+    img = _imagegrab().grab(bbox=(x, y, x + w, y + h))
+    _save_screenshot(img, path, max_dim)
+
+def _capture_mss(geom: Rect, path: str, sct=None, max_dim=None) -> None:
+    if sct is None:
+        with _mss().mss() as sct:
+            return _capture_mss(geom, path, sct, max_dim)
+    x, y, w, h = geom
+    img = sct.grab({'left': x, 'top': y, 'width': w, 'height': h})
+    img = Image.frombuffer('RGB', img.size, img.bgra, 'raw', 'BGRX', 0, 1)
+    _save_screenshot(img, path, max_dim)
+
+_CAPTURE_BACKENDS = {
+    'Darwin': _capture_imagegrab,
+    'Windows': _capture_imagegrab,
+    'Linux': _capture_mss,
+}
+
+class _MssSessions:
+    """
+    Drop-in for an mss instance that can be shared across capture threads.
+    mss instances are not thread-safe, so each thread lazily gets its own;
+    all of them are closed on exit.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = []
+
+    def _session(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._local.sct = _mss().mss()
+            with self._lock:
+                self._sessions.append(sct)
+        return sct
+
+    @property
+    def monitors(self):
+        return self._session().monitors
+
+    def grab(self, monitor):
+        return self._session().grab(monitor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for sct in self._sessions:
+            sct.close()
+
+def open_grabber():
+    """
+    Open a screen grabber to share across several capture_region calls, so the
+    display connection is set up once per thread instead of once per window.
+    Yields None on platforms whose backend keeps no session.
+    """
+    if _SYSTEM == 'Linux':
+        return _MssSessions()
+    return contextlib.nullcontext()
+
+def capture_region(geom: Rect, path: str, sct=None, max_dim=DEFAULT_MAX_DIM) -> bool:
+    """
+    Screenshot `geom` to `path`. The image is downscaled to fit within
+    max_dim x max_dim pixels before encoding; pass max_dim=None to keep
+    full resolution.
+    """
+    backend = _CAPTURE_BACKENDS.get(_SYSTEM)
+    if backend is None:
+        print(f"[WARN] Unsupported platform for screenshots: {_SYSTEM}")
+        return False
     try:
-        if system in ('Darwin', 'Windows'):
-            from PIL import ImageGrab
-            img = ImageGrab.grab(bbox=(
-                geom['x'],
-                geom['y'],
-                geom['x'] + geom['w'],
-                geom['y'] + geom['h']
-            ))
-            img.save(path)
-        elif system == 'Linux':
-            import mss
-            with mss.mss() as sct:
-                img = sct.grab({
-                    'left': geom['x'],
-                    'top': geom['y'],
-                    'width': geom['w'],
-                    'height': geom['h']
-                })
-                Image.frombytes('RGB', img.size, img.rgb).save(path)
-        else:
-            print(f"[WARN] Unsupported platform for screenshots: {system}")
-            return False
-        return is_image_valid(path)
+        # Pillow raises if encoding or writing fails, so no need to re-read the file.
+        backend(geom, path, sct, max_dim)
+        return True
+    except Exception as e:
+        print(f"[ERROR] Screenshot failed for region {geom}: {e}")
+        return False
+
+def grab_screen(sct=None):
+    """
+    Grab the whole virtual screen once so that many windows can be cropped from
+    it instead of each paying for its own display round-trip.
+    Returns (image, left, top), or None where per-region capture must be used.
+    """
+    # Only mss reports window and screen coordinates in the same pixel space;
+    # ImageGrab has to deal with HiDPI scaling per region.
+    if _SYSTEM != 'Linux' or sct is None:
+        return None
+    try:
+        monitor = sct.monitors[0]
+        shot = sct.grab(monitor)
+    except Exception as e:
+        print(f"[WARN] Full-screen grab failed, capturing per window: {e}")
+        return None
+    img = Image.frombuffer('RGB', shot.size, shot.bgra, 'raw', 'BGRX', 0, 1)
+    return img, monitor['left'], monitor['top']
+
+def crop_region(screen, geom: Rect, path: str, max_dim=DEFAULT_MAX_DIM) -> bool:
+    """Like capture_region, but crops `geom` out of a grab_screen() result."""
+    img, left, top = screen
+    x, y, w, h = geom
+    box = (
+        max(x - left, 0),
+        max(y - top, 0),
+        min(x + w - left, img.width),
+        min(y + h - top, img.height)
+    )
+    if box[0] >= box[2] or box[1] >= box[3]:
+        print(f"[WARN] Region {geom} is off-screen, no screenshot taken.")
+        return False
+    try:
+        _save_screenshot(img.crop(box), path, max_dim)
+        return True
     except Exception as e:
         print(f"[ERROR] Screenshot failed for region {geom}: {e}")
         return False
 
 def get_mouse_position():
-    system = platform.system()
     try:
-        if system == 'Darwin':
-            import Quartz
-            loc = Quartz.NSEvent.mouseLocation()
+        if _SYSTEM == 'Darwin':
+            loc = _quartz().NSEvent.mouseLocation()
             # Quartz’s origin is bottom-left; invert y for some frameworks if needed.
             return {'x': int(loc.x), 'y': int(loc.y)}
-        elif system == 'Linux':
+        elif _SYSTEM == 'Linux':
             # On Linux, use Xlib if installed (requires python-xlib)
-            from Xlib import display
+            display, _, _ = _xlib()
             data = display.Display().screen().root.query_pointer()._data
             return {'x': data['root_x'], 'y': data['root_y']}
-        elif system == 'Windows':
+        elif _SYSTEM == 'Windows':
             import ctypes
             pt = ctypes.wintypes.POINT()
             ctypes.windll.user32.GetCursorPos(ctypes.byref(pt))
@@ -135,18 +414,22 @@ def get_mouse_position():
     return None
 
 def get_active_window_title():
-    system = platform.system()
     try:
-        if system == 'Darwin':
-            from AppKit import NSWorkspace
-            return NSWorkspace.sharedWorkspace().frontmostApplication().localizedName()
-        elif system == 'Linux':
-            import subprocess
-            # Requires xprop and xdotool installed
-            win_id = subprocess.check_output(['xdotool', 'getactivewindow']).decode().strip()
-            title = subprocess.check_output(['xdotool', 'getwindowname', win_id]).decode().strip()
-            return title
-        elif system == 'Windows':
+        if _SYSTEM == 'Darwin':
+            return _nsworkspace().sharedWorkspace().frontmostApplication().localizedName()
+        elif _SYSTEM == 'Linux':
+            # Requires python-xlib and an EWMH-compliant window manager
+            display, _, X = _xlib()
+            d = display.Display()
+            try:
+                active = d.screen().root.get_full_property(
+                    d.intern_atom('_NET_ACTIVE_WINDOW'), X.AnyPropertyType
+                )
+                win = d.create_resource_object('window', active.value[0])
+                return _x_window_title(d, win)
+            finally:
+                d.close()
+        elif _SYSTEM == 'Windows':
             import ctypes
             user32 = ctypes.windll.user32
             kernel32 = ctypes.windll.kernel32
@@ -161,7 +444,7 @@ def get_active_window_title():
 
 def get_visible_windows_macos():
     try:
-        import Quartz
+        Quartz = _quartz()
         kCGWindowListOptionOnScreenOnly = 1
         kCGWindowListExcludeDesktopElements = 16
         kCGNullWindowID = 0
@@ -173,21 +456,24 @@ def get_visible_windows_macos():
         print("[ERROR] Quartz not available or unsupported macOS version.")
         return []
 
-    covered = []
-    visible_windows = []
+    candidates = []
     for w in wins:
         bounds = w.get("kCGWindowBounds", {})
         if not bounds or not w.get("kCGWindowName") or not w.get("kCGWindowIsOnscreen", True):
             continue
-        geom = {
-            'x': int(bounds.get("X", 0)),
-            'y': int(bounds.get("Y", 0)),
-            'w': int(bounds.get("Width", 0)),
-            'h': int(bounds.get("Height", 0))
-        }
-        if geom['w'] <= 1 or geom['h'] <= 1:
+        geom = Rect(
+            int(bounds.get("X", 0)),
+            int(bounds.get("Y", 0)),
+            int(bounds.get("Width", 0)),
+            int(bounds.get("Height", 0))
+        )
+        if geom.w <= 1 or geom.h <= 1:
             continue
-        uncovered = rect_subtract(geom, covered)
+        candidates.append((w, geom))
+
+    regions = compute_visible([geom for _, geom in candidates])
+    visible_windows = []
+    for (w, geom), uncovered in zip(candidates, regions):
         if uncovered:
             visible_windows.append({
                 'id': str(w.get("kCGWindowNumber")),
@@ -196,11 +482,62 @@ def get_visible_windows_macos():
                 'uncovered_regions': uncovered,
                 'owner': w.get("kCGWindowOwnerName", "")
             })
-            covered.append(geom)
     return visible_windows
 
+def _x_window_title(d, win):
+    prop = win.get_full_property(d.intern_atom('_NET_WM_NAME'), d.intern_atom('UTF8_STRING'))
+    if prop and prop.value:
+        return prop.value.decode('utf-8', 'replace')
+    name = win.get_wm_name()
+    if isinstance(name, bytes):
+        return name.decode('latin-1')
+    return name or ''
+
 def get_visible_windows_linux():
-    """Linux implementation using wmctrl + xwininfo (requires wmctrl, xwininfo)."""
+    """Linux implementation using python-xlib, or wmctrl when it is not installed."""
+    try:
+        display, error, X = _xlib()
+    except ImportError:
+        return _get_visible_windows_wmctrl()
+
+    try:
+        d = display.Display()
+    except Exception:
+        print("[ERROR] Could not open the X display.")
+        return []
+
+    candidates = []
+    try:
+        root = d.screen().root
+        stacking = root.get_full_property(
+            d.intern_atom('_NET_CLIENT_LIST_STACKING'), X.AnyPropertyType
+        )
+        if stacking is None:
+            print("[ERROR] Window manager does not publish _NET_CLIENT_LIST_STACKING.")
+            return []
+        # The stacking list runs bottom-to-top; occlusion needs front-to-back.
+        for wid in reversed(stacking.value):
+            win = d.create_resource_object('window', wid)
+            try:
+                if win.get_attributes().map_state != X.IsViewable:
+                    continue
+                title = _x_window_title(d, win)
+                size = win.get_geometry()
+                origin = root.translate_coords(win, 0, 0)
+            except error.XError:
+                # Window went away while we were enumerating.
+                continue
+            geom = Rect(origin.x, origin.y, size.width, size.height)
+            if geom.w <= 1 or geom.h <= 1 or title.strip() == "":
+                continue
+            candidates.append((f"0x{wid:08x}", title, geom))
+    finally:
+        d.close()
+
+    return _linux_visible_windows(candidates)
+
+def _get_visible_windows_wmctrl():
+    """Fallback using wmctrl (requires wmctrl)."""
     try:
         import subprocess
 
@@ -210,26 +547,23 @@ def get_visible_windows_linux():
         print("[ERROR] wmctrl not available or failed.")
         return []
 
-    covered = []
-    visible_windows = []
+    candidates = []
     for line in lines:
-        parts = line.split(None, 6)
-        if len(parts) < 7:
+        m = _WMCTRL_RE.match(line)
+        if not m:
             continue
-        win_id, desktop, x, y, w, h, title = parts
-        try:
-            geom = {
-                'x': int(x),
-                'y': int(y),
-                'w': int(w),
-                'h': int(h)
-            }
-        except ValueError:
-            continue
-        if geom['w'] <= 1 or geom['h'] <= 1 or title.strip() == "":
+        win_id, x, y, w, h, title = m.groups()
+        geom = Rect(int(x), int(y), int(w), int(h))
+        if geom.w <= 1 or geom.h <= 1 or title.strip() == "":
             continue
+        candidates.append((win_id, title, geom))
+
+    return _linux_visible_windows(candidates)
 
-        uncovered = rect_subtract(geom, covered)
+def _linux_visible_windows(candidates):
+    regions = compute_visible([geom for _, _, geom in candidates])
+    visible_windows = []
+    for (win_id, title, geom), uncovered in zip(candidates, regions):
         if uncovered:
             visible_windows.append({
                 'id': win_id,
@@ -238,25 +572,27 @@ def get_visible_windows_linux():
                 'uncovered_regions': uncovered,
                 'owner': None
             })
-            covered.append(geom)
 
     return visible_windows
 
 def get_visible_windows_windows():
     """Windows implementation using pygetwindow (requires pygetwindow)."""
     try:
-        import pygetwindow as gw
+        gw = _pygetwindow()
     except ImportError:
         print("[ERROR] pygetwindow not installed.")
         return []
 
-    covered = []
-    visible_windows = []
+    candidates = []
     for w in gw.getAllWindows():
         if not w.isVisible or w.width <= 1 or w.height <= 1:
             continue
-        geom = {'x': w.left, 'y': w.top, 'w': w.width, 'h': w.height}
-        uncovered = rect_subtract(geom, covered)
+        geom = Rect(w.left, w.top, w.width, w.height)
+        candidates.append((w, geom))
+
+    regions = compute_visible([geom for _, geom in candidates])
+    visible_windows = []
+    for (w, geom), uncovered in zip(candidates, regions):
         if uncovered:
             visible_windows.append({
                 'id': str(w._hWnd),
@@ -265,22 +601,27 @@ def get_visible_windows_windows():
                 'uncovered_regions': uncovered,
                 'owner': None
             })
-            covered.append(geom)
     return visible_windows
 
+_VISIBLE_WINDOW_BACKENDS = {
+    'Darwin': get_visible_windows_macos,
+    'Linux': get_visible_windows_linux,
+    'Windows': get_visible_windows_windows,
+}
+
 def get_visible_windows():
-    system = platform.system()
-    if system == 'Darwin':
-        return get_visible_windows_macos()
-    elif system == 'Linux':
-        return get_visible_windows_linux()
-    elif system == 'Windows':
-        return get_visible_windows_windows()
-    else:
-        print(f"[WARN] Visible-window detection not implemented for {system}.")
+    backend = _VISIBLE_WINDOW_BACKENDS.get(_SYSTEM)
+    if backend is None:
+        print(f"[WARN] Visible-window detection not implemented for {_SYSTEM}.")
         return []
+    return backend()
 
-def save_window_map():
+def save_window_map(max_dim=DEFAULT_MAX_DIM, compact_regions=False):
+    """
+    Capture every visible window and write window_map/window_map.json.
+    With compact_regions=True each window stores a 64x64 tile bitmap of its
+    uncovered area (see regions_bitmap) instead of the list of rectangles.
+    """
     windows = get_visible_windows()
     if not windows:
         print("[INFO] No visible windows found or failed to retrieve window info.")
@@ -290,19 +631,41 @@ def save_window_map():
     os.makedirs(out_dir, exist_ok=True)
     entries = []
 
+    # FAST_SCREENSHOT=1 trades PNG for JPEG, which encodes several times faster.
+    ext = 'jpg' if os.environ.get('FAST_SCREENSHOT') == '1' else 'png'
+    tasks = []
     for w in windows:
         title_sn = sanitize_filename(w['title']) or 'no_title'
-        filename = f"{w['id']}_{title_sn}.png"
-        path = os.path.join(out_dir, filename)
-        success = capture_region(w['geometry'], path)
-        entries.append({
+        filename = f"{w['id']}_{title_sn}.{ext}"
+        tasks.append((w, filename, os.path.join(out_dir, filename)))
+
+    workers = min(_MAX_CAPTURE_WORKERS, len(tasks))
+    with open_grabber() as sct, ThreadPoolExecutor(max_workers=workers) as pool:
+        screen = grab_screen(sct)
+        if screen is not None:
+            def capture(task):
+                return crop_region(screen, task[0]['geometry'], task[2], max_dim=max_dim)
+        else:
+            def capture(task):
+                return capture_region(task[0]['geometry'], task[2], sct=sct, max_dim=max_dim)
+        results = list(pool.map(capture, tasks))
+
+    for (w, filename, _), success in zip(tasks, results):
+        entry = {
             'id': w['id'],
             'title': w['title'],
             'owner': w.get('owner', ''),
-            'geometry': w['geometry'],
-            'uncovered_regions': w['uncovered_regions'],
-            'screenshot': filename if success else None
-        })
+            'geometry': w['geometry']._asdict(),
+        }
+        if compact_regions:
+            entry['uncovered_bitmap'] = {
+                'tiles': _BITMAP_TILES,
+                'data': regions_bitmap(w['geometry'], w['uncovered_regions'])
+            }
+        else:
+            entry['uncovered_regions'] = [r._asdict() for r in w['uncovered_regions']]
+        entry['screenshot'] = filename if success else None
+        entries.append(entry)
 
     snapshot_info = {
         'timestamp': datetime.datetime.now().isoformat(),
@@ -318,8 +681,13 @@ def save_window_map():
     }
 
     json_path = os.path.join(out_dir, 'window_map.json')
-    with open(json_path, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    orjson = _orjson()
+    if orjson is not None:
+        with open(json_path, 'wb') as f:
+            f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+    else:
+        with open(json_path, 'w') as f:
+            json.dump(metadata, f, indent=2)
 
     print(f"[INFO] Saved window map and context to {json_path}")
 